@@ -1,4 +1,4 @@
-from repohealth.twitter import RepoTweet
+from repohealth.twitter import RepoTweet, content_index
 
 
 def report_contents():
@@ -51,6 +51,37 @@ def test_drop_content_multiple():
     assert list(content.keys()) == ['wibble']
 
 
+def test_drop_content_index():
+    tp = RepoTweet('my pattern {name}')
+
+    content = report_contents()
+    index = content_index(content)
+    tp.drop_content('my pattern foobar', content, index)
+    assert list(content.keys()) == ['wibble']
+
+    # Already dropped, so nothing more to do.
+    tp.drop_content('my pattern foobar', content, index)
+    assert list(content.keys()) == ['wibble']
+
+
+def test_content_index():
+    index = content_index(report_contents())
+    assert index['name'] == {'foobar': ['foobar'], 'wibble': ['wibble']}
+    assert index['uuid']['something generic with a space'] == ['wibble']
+    assert index['url']['https://blahblah/foo'] == ['foobar']
+
+
+def test_content_index_shared_value():
+    index = content_index({'a/numpy': {'name': 'numpy'},
+                           'b/numpy': {'name': 'numpy'}})
+    assert index['name'] == {'numpy': ['a/numpy', 'b/numpy']}
+
+
+def test_content_index_missing_fields():
+    index = content_index({'foobar': {'name': 'foobar'}})
+    assert index == {'uuid': {}, 'name': {'foobar': ['foobar']}, 'url': {}}
+
+
 
 if __name__ == '__main__':
     import pytest, sys
@@ -1,4 +1,6 @@
-from repohealth.twitter import TweetPattern, LotsOfForks
+import gc
+
+from repohealth.twitter import TweetPattern, LotsOfForks, NReposInCachePattern
 import repohealth.twitter
 
 
@@ -11,27 +13,84 @@ def test_all_subclasses():
     assert repohealth.twitter.LotsOfForks in TweetPattern.all_subclasses()
 
 
+def forget_subclasses():
+    """
+    Let any subclasses that a test has finished with be garbage collected,
+    as the subclass cache holds references to them.
+
+    """
+    TweetPattern._subclass_cache.clear()
+    gc.collect()
+
+
+def subclass_names():
+    return [klass.__name__ for klass in TweetPattern.all_subclasses()]
+
+
+def test_all_subclasses_new_subclass():
+    # Populate the cache before defining the new subclass.
+    TweetPattern.all_subclasses()
+
+    # An empty patterns list means this class won't affect other tests.
+    class NewPattern(LotsOfForks):
+        patterns = []
+
+    assert NewPattern in TweetPattern.all_subclasses()
+    assert NewPattern.all_subclasses() == (NewPattern, )
+
+    del NewPattern
+    forget_subclasses()
+    assert 'NewPattern' not in subclass_names()
+
+
 def test_repr():
     tp = TweetPattern('my pattern .*')
     assert repr(tp) == '<TweetPattern TweetPattern "my pattern .*">'
 
 
+def test_format():
+    tp = TweetPattern('{name} at {repohealth_url}')
+    assert tp.format({'name': 'foo'}, {'repohealth_url': 'bar'}) == 'foo at bar'
+    assert tp.format({'name': 'foo', 'repohealth_url': 'bar'}) == 'foo at bar'
+
+
 def test_re_match():
     tp = TweetPattern('my pattern .*')
 
-    # Check there is no re cache.
-    assert not hasattr(tp, 'compiled_regexp')
-
     r = tp.re_match('my tweet pattern shouldnt work')
     assert r is None
 
-    # Check that the cache has worked.
-    assert hasattr(tp, 'compiled_regexp')
+    # Check that the compiled regexp is shared between instances.
+    assert TweetPattern('my pattern .*').compiled_regexp is tp.compiled_regexp
 
     r = tp.re_match('my pattern actually works')
     assert r is None
 
 
+def test_patterns_precompiled():
+    for klass in TweetPattern.all_subclasses():
+        for pattern in klass.patterns:
+            assert pattern in TweetPattern._compiled
+
+
+def test_all_patterns_follows_patterns():
+    class ChangingPatterns(TweetPattern):
+        patterns = []
+
+    ChangingPatterns.patterns.append('Appended {name}')
+    [appended] = ChangingPatterns.all_patterns()
+    assert appended.re_match('Appended foo')
+
+    ChangingPatterns.patterns = ['Replaced {name}']
+    [replaced] = ChangingPatterns.all_patterns()
+    assert replaced.pattern == 'Replaced {name}'
+    assert replaced.re_match('Replaced foo')
+
+    del ChangingPatterns, appended, replaced
+    forget_subclasses()
+    assert 'ChangingPatterns' not in subclass_names()
+
+
 def realistic_content():
     return {'test': {'name': 'test',
                      'uuid': 'unique/test',
@@ -66,6 +125,21 @@ def test_LotsOfForks():
             assert message == expected
             assert tweeter.re_match(message)
 
+    # The original content must not have been modified.
+    assert 'forks_over_or_nearly' not in content['test']
+
+
+
+def test_NReposInCachePattern():
+    content = {name: {'github': {'repo': {'name': name,
+                                          'stargazers_count': stars}}}
+               for name, stars in [['a', 30], ['b', 10], ['c', 40], ['d', 20]]}
+    pattern = NReposInCachePattern(NReposInCachePattern.patterns[0])
+
+    [(tweeter, context)] = pattern.context(content)
+    assert context['n_repos'] == 4
+    assert context['names'] == ['b', 'd', 'a']
+
 
 
 if __name__ == '__main__':
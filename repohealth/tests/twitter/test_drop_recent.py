@@ -0,0 +1,74 @@
+from repohealth.twitter import drop_recent, RepoTweet, TweetPattern
+
+
+def report_contents():
+    return {'foobar': {'name': 'foobar',
+                       'url': 'https://blahblah/foo',
+                       'uuid': 'org/foobar'},
+            'wibble': {'name': 'wibble',
+                       'url': 'ftp://noteventherightname',
+                       'uuid': 'something generic with a space'}}
+
+
+def test_no_matches():
+    patterns = [TweetPattern('generic tweet'), RepoTweet('Report for {name}')]
+    content = report_contents()
+    result = drop_recent(['unrelated'], patterns, content)
+    assert result == patterns
+    assert list(content.keys()) == ['foobar', 'wibble']
+
+
+def test_matched_patterns_dropped():
+    generic, repo = TweetPattern('generic tweet'), RepoTweet('Report for {name}')
+    content = report_contents()
+    result = drop_recent(['generic tweet', 'unrelated'],
+                         iter([generic, repo]), content)
+    assert result == [repo]
+    assert list(content.keys()) == ['foobar', 'wibble']
+
+
+def test_all_matching_content_dropped():
+    repo = RepoTweet('Report for {name}')
+    content = report_contents()
+    result = drop_recent(['Report for foobar', 'Report for wibble'], [repo], content)
+    assert result == []
+    assert content == {}
+
+
+def test_shared_name():
+    # Forks share a name, and twitter shortens the URLs so they can't help.
+    content = {uuid: {'name': 'numpy', 'uuid': uuid,
+                      'url': 'repohealth.info/report/{}'.format(uuid)}
+               for uuid in ['a/numpy', 'b/numpy', 'c/numpy']}
+    repo = RepoTweet('Just generated a health report for {name} at {url}')
+    messages = ['Just generated a health report for numpy at https://t.co/abc',
+                'Just generated a health report for numpy at https://t.co/xyz']
+    result = drop_recent(messages, [repo], content)
+    assert result == []
+    assert list(content.keys()) == ['c/numpy']
+
+
+def test_first_matching_pattern():
+    first, second = RepoTweet('Report for {name}'), RepoTweet('Report for {uuid}')
+    content = report_contents()
+    result = drop_recent(['Report for foobar'], [first, second], content)
+    assert result == [second]
+    assert list(content.keys()) == ['wibble']
+
+
+def test_generic_match_without_repo_fields():
+    patterns = list(TweetPattern.all_patterns())
+    message = patterns[0].format({'repohealth_url': 'x'})
+    content = {'a': {'github': {}}}
+    result = drop_recent([message], patterns, content)
+    assert result == patterns[1:]
+    assert list(content.keys()) == ['a']
+
+
+def test_no_patterns():
+    assert drop_recent(['generic tweet'], iter([]), report_contents()) == []
+
+
+if __name__ == '__main__':
+    import pytest
+    pytest.main([__file__])
@@ -0,0 +1,43 @@
+import re
+
+from repohealth.twitter import format_regexp
+
+
+def test_custom_key_type():
+    r, _ = format_regexp('{test} the {contents}', special={'contents': '[0-9]+'})
+    assert re.match(r, 'Testing the 123').groups() == ('Testing', '123')
+    assert re.match(r, 'Testing the contents') is None
+
+
+def test_return_fields():
+    _, fields = format_regexp('{The} keys {from this} format {string} are '
+                              '{0} attain{able} {from this} object')
+    expected = ['The', 'from this', 'string', '0', 'able', 'from this']
+    assert fields == expected
+
+
+def test_indexed_field():
+    r, fields = format_regexp('#{names[0]} and #{names[1]}')
+    assert fields == ['names[0]', 'names[1]']
+    assert re.fullmatch(r, '#foo and #bar').groups() == ('foo', 'bar')
+
+
+def test_escaped_literals():
+    r, _ = format_regexp('Stars (+{n}) ^[so far]$ | {name}? \\o/')
+    match = re.fullmatch(r, 'Stars (+12) ^[so far]$ | wibble? \\o/')
+    assert match.groups() == ('12', 'wibble')
+    assert re.fullmatch(r, 'Stars +12 so far | wibble') is None
+
+
+def test_doubled_braces():
+    pattern = 'Use {{braces}} for {name} and {{{literal}}}'
+    r, fields = format_regexp(pattern)
+    assert fields == ['name', 'literal']
+    message = pattern.format(name='x', literal='y')
+    assert message == 'Use {braces} for x and {y}'
+    assert re.fullmatch(r, message).groups() == ('x', 'y')
+
+
+if __name__ == '__main__':
+    import pytest
+    pytest.main([__file__])
@@ -13,6 +13,15 @@ def test_large():
     assert round_sig(12345, 4) == 12340
 
 
+def test_int_matches_float():
+    for x in [1, 9, 10, 95, 99, 100, 1234, 1601, 99999]:
+        assert round_sig(x, 2) == round_sig(float(x), 2)
+
+
+def test_bool():
+    assert round_sig(True, 2) == 1
+
+
 
 if __name__ == '__main__':
     import pytest, sys
@@ -1,29 +1,50 @@
+from collections import ChainMap
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from heapq import nsmallest
+from math import floor, log10
+import os
+import random
 import re
-import string
 
 
-class RegexpFormatter(string.Formatter):
-    """
-    Fill in a .format-able string with regular expression groups.
+#: Matches the replacement fields of a .format-able string, as well as the doubled
+#: braces that stand for a literal brace.
+_FIELD_RE = re.compile(r'\{\{|\}\}|\{([^{}]+)\}')
 
-        >>> f = RegexpFormatter()
-        >>> f.format('{This} is an expansion {pattern}')
-        '(.*?) is an expansion (.*?)'
-        >>> print(f.fields)
-        ['This', 'pattern']
-        >>> f.format('We can do {custom patterns} too', special={'custom patterns': '0-9+'})
-        'We can do (0-9+) too'
 
+def format_regexp(pattern, special=None):
     """
-    def __init__(self, *args, **kwargs):
-        self.fields = []
-        super().__init__(*args, **kwargs)
+    Fill in a .format-able string with regular expression groups, returning the
+    regular expression and the names of the fields that were substituted.
+    The literal text of the pattern is escaped, so that only the fields are
+    free to match.
+
+        >>> regexp, fields = format_regexp('{This} is an expansion (of a {pattern})')
+        >>> re.match(regexp, 'Something is an expansion (of a thing)').groups()
+        ('Something', 'thing')
+        >>> print(fields)
+        ['This', 'pattern']
+        >>> format_regexp('{custom}', special={'custom': '[0-9]+'})[0]
+        '([0-9]+)'
 
-    def get_field(self, field_name, args, kwargs):
-        special = kwargs.get('special', {})
-        field = special.get(field_name, r'.*?')
-        self.fields.append(field_name)
-        return ('({})'.format(field), field_name)
+    """
+    special = special or {}
+    fields = []
+    parts = []
+    end = 0
+    for match in _FIELD_RE.finditer(pattern):
+        parts.append(re.escape(pattern[end:match.start()]))
+        name = match.group(1)
+        if name is None:
+            # A doubled brace formats as a single literal brace.
+            parts.append(re.escape(match.group()[0]))
+        else:
+            fields.append(name)
+            parts.append('({})'.format(special.get(name, r'.*?')))
+        end = match.end()
+    parts.append(re.escape(pattern[end:]))
+    return ''.join(parts), fields
 
 
 class TweetPattern(object):
@@ -39,19 +60,39 @@ class TweetPattern(object):
                 'If you want to find out how your favourite repository is faring, take a look at {repohealth_url}',
                 ]
 
+    #: Flattened subclass hierarchies, keyed by class. Cleared whenever a new subclass
+    #: is defined. Note that the cache holds references to the subclasses, so the
+    #: hierarchy is treated as permanent: a discarded subclass is only garbage
+    #: collected once the cache has been cleared.
+    _subclass_cache = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        TweetPattern._subclass_cache.clear()
+        cls._compile_patterns()
+
+    @classmethod
+    def _walk_subclasses(cls):
+        for klass in cls.__subclasses__():
+            yield klass
+            # Recurse into subsubclasses
+            yield from klass._walk_subclasses()
+
     @classmethod
     def all_subclasses(cls, include_self=True):
         """
-        Generator that recursively yields all subclasses of this class.
+        Return a tuple of all the (recursive) subclasses of this class.
+        The result is cached (see ``_subclass_cache``).
 
         """
-        if include_self:
-            yield cls
+        try:
+            subclasses = cls._subclass_cache[cls]
+        except KeyError:
+            subclasses = cls._subclass_cache[cls] = tuple(cls._walk_subclasses())
 
-        for klass in cls.__subclasses__():
-            yield klass
-            # Recurse into subsubclasses
-            yield from klass.all_subclasses(include_self=False)
+        if include_self:
+            return (cls, ) + subclasses
+        return subclasses
 
     @classmethod
     def all_patterns_all_subclasses(cls, include_self=True):
@@ -72,24 +113,45 @@ class TweetPattern(object):
         for pattern in cls.patterns[:]:
             yield cls(pattern)
 
+    #: Compiled regular expressions (and their field names), keyed by pattern string.
+    #: Shared by all subclasses, as the compiled form depends only on the pattern.
+    _compiled = {}
+
+    @classmethod
+    def _compile_pattern(cls, pattern):
+        """
+        Return the ``(compiled_regexp, re_fields)`` pair for the given pattern string,
+        compiling it only the first time it is seen.
+
+        """
+        try:
+            return cls._compiled[pattern]
+        except KeyError:
+            pass
+
+        regexp, fields = format_regexp(pattern)
+        compiled = (re.compile(regexp), fields)
+        cls._compiled[pattern] = compiled
+        return compiled
+
+    @classmethod
+    def _compile_patterns(cls):
+        """
+        Compile the patterns of this class up-front, rather than on first match.
+
+        """
+        for pattern in cls.patterns:
+            cls._compile_pattern(pattern)
+
     def __init__(self, pattern):
         self.pattern = pattern
+        self.compiled_regexp, self.re_fields = self._compile_pattern(pattern)
 
     def __repr__(self):
         return '<TweetPattern {} "{}">'.format(self.__class__.__name__, self.pattern)
 
     def re_match(self, tweet):
-        if not hasattr(self, 'compiled_regexp'):
-            def escape(pattern):
-                return pattern.replace('?', r'\?').replace('*', '\*').replace('.', '\.')
-
-            p = escape(self.pattern)
-            re_formatter = RegexpFormatter()
-            regexp = re_formatter.format(p)
-            self.re_fields = re_formatter.fields
-            self.compiled_regexp = re.compile(regexp + '$')
-
-        return self.compiled_regexp.match(tweet)
+        return self.compiled_regexp.fullmatch(tweet)
 
     def condition(self, context):
         """
@@ -113,8 +175,8 @@ class TweetPattern(object):
         for formatting the tweet. This is useful for adding extra computed keys to
         the context.
 
-        Note: Any modifications to context should be done in a copy, not the original
-        input (dictionary).
+        Note: Any modifications to context should be done in a copy (or an overlay,
+        such as a :class:`collections.ChainMap`), not the original input (dictionary).
 
         """
         return context
@@ -124,12 +186,17 @@ class TweetPattern(object):
         Where the substitution into the pattern takes place.
 
         """
-        return self.pattern.format(**(extra_context or {}), **context)
+        if extra_context:
+            context = ChainMap(context, extra_context)
+        return self.pattern.format_map(context)
 
-    def drop_content(self, message, content):
+    def drop_content(self, message, content, index=None):
         return
 
 
+TweetPattern._compile_patterns()
+
+
 class NReposInCachePattern(TweetPattern):
     patterns = ['I recently generated reports for #{names[0]} and #{names[1]} on {repohealth_url}',
                ]
@@ -139,34 +206,57 @@ class NReposInCachePattern(TweetPattern):
 
     def updated_context(self, context):
         # TODO: Sort by n_stars/n_forks.
-        top_repos = sorted(context.values(),
-                           key=lambda k: k['github']['repo']['stargazers_count'])
+        top_repos = nsmallest(3, context.values(), key=stargazers)
         names = [content['github']['repo']['name']
-                 for content in top_repos[:3]]
+                 for content in top_repos]
         return dict(**context, n_repos=len(context),
                     names=names)
         
 
+#: The context fields which identify the repository that a tweet was about.
+_CHECKABLE = ('uuid', 'name', 'url')
+
+
+def content_index(content, fields=_CHECKABLE):
+    """
+    Build a reverse index of ``{field: {value: [uuid, ...]}}`` for the given content,
+    such that a matched field value can be looked up without searching the content.
+    Values may be shared (e.g. forks have the same name), so the uuids are listed
+    in content order. Fields missing from a context are skipped.
+
+    """
+    index = {field: {} for field in fields}
+    for uuid, context in content.items():
+        for field in fields:
+            if field in context:
+                index[field].setdefault(str(context[field]), []).append(uuid)
+    return index
+
+
 class RepoTweet(TweetPattern):
     patterns = [
                 'Just generated a health report for {name} at {url}',
                 ]
 
-    def drop_content(self, message, content):
+    def drop_content(self, message, content, index=None):
         """
         Given this pattern was the creator of the given message, remove the appropriate
         content to prevent further tweetage about this repository.
 
+        The index, as returned by :func:`content_index`, may be passed in to avoid
+        rebuilding it for each message.
+
         """
         match = self.re_match(message)
-        checkable = ['uuid', 'name', 'url']
+        if index is None:
+            index = content_index(content)
 
         for f, g in zip(self.re_fields, match.groups()):
-            if f in checkable:
-                for uuid, context in content.items():
-                    if '{{{}}}'.format(f).format(**context) == g:
-                        content.pop(uuid)
-                        return
+            for uuid in index.get(f, {}).get(g, ()):
+                # The content may already have been dropped (by an earlier message).
+                if uuid in content:
+                    content.pop(uuid)
+                    return
 
     def condition(self, context):
         """
@@ -189,7 +279,13 @@ class RepoTweet(TweetPattern):
 
 
 def round_sig(x, sig=2):
-    from math import floor, log10
+    """
+    Round the given number to the given number of significant figures.
+
+    """
+    if type(x) is int and x > 0:
+        # Integers (e.g. star counts) don't need log10 to find their magnitude.
+        return round(x, sig - len(str(x)))
     return round(x, sig-int(floor(log10(x)))-1)
 
 
@@ -208,6 +304,22 @@ def round_with_direction_string(x):
     return rounded, over_nearly_or_exactly
 
 
+#: The wording to put before a rounded number, given the direction of the rounding.
+_DIRECTION_PREFIX = {'less than': 'over ',
+                     'more than': 'nearly ',
+                     'same as': ''}
+
+
+def rounded_context(context, x, key, prefix_key):
+    """
+    Overlay the rounded value of x (under key) and the wording for the rounding's
+    direction (under prefix_key) on the given context, without copying it.
+
+    """
+    rounded, direction = round_with_direction_string(x)
+    return ChainMap({key: rounded, prefix_key: _DIRECTION_PREFIX[direction]}, context)
+
+
 # Some extremely useful statistics from the data payload.
 stargazers = lambda context: context['github']['repo']['stargazers_count']
 forks = lambda context: context['github']['repo']['forks_count']
@@ -222,16 +334,8 @@ class LotsOfStars(RepoTweet):
         return stargazers(context) >= 50
 
     def updated_context(self, context):
-        context = context.copy()
-        n_stars = stargazers(context)
-        n_stars_rd, direction = round_with_direction_string(n_stars)
-        over_nearly_or_exactly = {'less than': 'over ',
-                                  'more than': 'nearly ',
-                                  'same as': ''}
-        
-        context.update({'n_stargazers': n_stars_rd,
-                        'stars_over_or_nearly': over_nearly_or_exactly[direction]})
-        return context
+        return rounded_context(context, stargazers(context),
+                               'n_stargazers', 'stars_over_or_nearly')
 
 
 class LotsOfForks(RepoTweet):
@@ -241,21 +345,13 @@ class LotsOfForks(RepoTweet):
         return forks(context) >= 50
 
     def updated_context(self, context):
-        context = context.copy()
-        n_forks = forks(context)
-        n_forks_rd, direction = round_with_direction_string(n_forks)
-        over_nearly_or_exactly = {'less than': 'over ',
-                                  'more than': 'nearly ',
-                                  'same as': ''}
-        
-        context.update({'forks': n_forks_rd,
-                        'forks_over_or_nearly': over_nearly_or_exactly[direction]})
-        return context
+        return rounded_context(context, forks(context),
+                               'forks', 'forks_over_or_nearly')
 
 
 def twitter_api():
+    # Imported here so that the patterns can be used without the twitter client installed.
     import tweepy
-    import os
 
     consumer_key = os.environ['consumer_key']
     consumer_secret = os.environ['consumer_secret']
@@ -276,51 +372,83 @@ def get_tweets(api):
 
 
 def drop_recent(recent_messages, patterns, content):
-    result = patterns.copy()
-    for pattern in patterns:
-        for message in recent_messages:
-            if pattern.re_match(message):
-                pattern.drop_content(message, content)
-                if pattern in result:
-                    result.remove(pattern)
-    return result
+    """
+    Return the patterns that don't match any of the recent messages, dropping
+    the content that was the subject of the recent messages that did match.
+
+    Note: A message is attributed to the first pattern that matches it.
+
+    """
+    patterns = list(patterns)
+    if not patterns:
+        return patterns
+
+    # A single alternation of all of the patterns, such that each message is
+    # scanned once, and the named group that matched identifies the pattern.
+    combined = re.compile('|'.join('(?P<p{}>{})'.format(i, pattern.compiled_regexp.pattern)
+                                   for i, pattern in enumerate(patterns)))
+    matched = set()
+    index = None
+    checkable = set(_CHECKABLE)
+    for message in recent_messages:
+        match = combined.fullmatch(message)
+        if match:
+            i = int(match.lastgroup[1:])
+            pattern = patterns[i]
+            # Only build the index once a pattern that can look content up has matched.
+            if index is None and not checkable.isdisjoint(pattern.re_fields):
+                index = content_index(content)
+            pattern.drop_content(message, content, index)
+            matched.add(i)
+    return [pattern for i, pattern in enumerate(patterns) if i not in matched]
 
 
 def tweet_status():
     patterns = TweetPattern.all_patterns_all_subclasses()
 
+    # Imported here to avoid pulling in the whole report generation stack on import.
     import repohealth.generate
     avail = repohealth.generate.in_cache()
 
     api = twitter_api()
-    recently_tweeted = list(get_tweets(api))
 
-    # We don't need a token - the report is already generated.
-    content = {uuid: repohealth.generate.repo_data(uuid, token=None)
-               for uuid in avail}
+    # Loading the reports and fetching the timeline are independent (and I/O bound),
+    # so do them concurrently.
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        # Timelines can repeat themselves; only the unique tweets need matching (in order).
+        recent_tweets = executor.submit(lambda: tuple(dict.fromkeys(get_tweets(api))))
+
+        # We don't need a token - the report is already generated.
+        content = dict(zip(avail, executor.map(partial(repohealth.generate.repo_data,
+                                                       token=None),
+                                               avail)))
+        recently_tweeted = recent_tweets.result()
 
     # Universally add extra content to our report context.
     for uuid, context in content.items():
         context.setdefault('uuid', uuid)
         context['name'] = context['github']['repo']['name']
-        context['url'] = 'repohealth.info/report/{}'.format(uuid)
+        context['url'] = f'repohealth.info/report/{uuid}'
 
     global_context = {'repohealth_url': 'repohealth.info'}
 
     patterns = drop_recent(recently_tweeted, patterns, content)
 
-    tweet_options = []
+    # Pick one of the tweet options uniformly at random, as they are generated
+    # (reservoir sampling), rather than collecting them all first.
+    msg = None
+    n_options = 0
     for pattern_gen in patterns:
         for pattern, context in pattern_gen.context(content):
-            tweet_options.append(pattern.format(context, global_context))
+            n_options += 1
+            if random.randrange(n_options) == 0:
+                msg = pattern.format(context, global_context)
 
     # TODO: Filter out tweets longer than 140 NFC chars.
 
-    if not tweet_options:
+    if msg is None:
         print('Nothing to tweet :(')
     else:
-        import random
-        msg = random.choice(tweet_options)
         print('TWEETING: {}'.format(msg))
         if True:
             api.update_status(msg)